@@ -0,0 +1,3 @@
+# -*- coding: utf-8 -*-
+
+from enterprise_extensions.pipe.data_class import RunSettings  # noqa: F401
@@ -0,0 +1,520 @@
+# -*- coding: utf-8 -*-
+
+import collections
+import functools
+import importlib
+import inspect
+import json
+import logging
+import math
+import operator
+import os
+import pickle
+import re
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from configparser import ConfigParser, ExtendedInterpolation
+from dataclasses import dataclass, field
+from types import MappingProxyType
+
+import numpy as np
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+_SECTION = re.compile(r"^\[([^\]]+)\]")
+_KV = re.compile(r"^([^=;#\s][^=]*?)\s*=\s*(.*)$")
+_INTERPOLATION = re.compile(r"\$\{(?:([^}:]+):)?([^}:]+)\}")
+# matches configparser.MAX_INTERPOLATION_DEPTH
+_MAX_INTERPOLATION_DEPTH = 10
+
+# importlib.import_module takes the import lock even when the module is
+# already in sys.modules, so remember modules imported for custom sections
+_MODULE_CACHE = {}
+
+# parsed section mappings keyed on (path, mtime_ns, size), so repeated
+# update_from_file calls on an unchanged file skip the parse entirely
+_CONFIG_CACHE = {}
+
+# converters for annotated types that need more than a plain constructor
+# call; anything not listed here is called directly on the string value
+_TYPE_HANDLERS = {
+    bool: lambda value: value.strip().lower() in ('true', '1', 'yes'),
+    np.ndarray: lambda value: np.array(value.split(','), dtype=np.float64),
+}
+
+# converted section items keyed on (items, types), so repeated model loads
+# against the same config section skip the string -> value conversions
+_APPLY_TYPES_CACHE = {}
+
+# FUNCTION_CALL: expressions are evaluated against these names only, and
+# their compiled code objects are cached so repeated directives are cheap;
+# the empty __builtins__ stops eval from injecting the real builtins
+_EVAL_GLOBALS = {'np': np, 'math': math, '__builtins__': {}}
+_EVAL_CACHE = {}
+
+
+def _hash_params(params, refs):
+    """
+    Build a hashable fingerprint of a function-parameter dict. Primitive
+    values are used directly, small numpy arrays are fingerprinted by
+    content and large ones by identity, nested dicts recurse, and anything
+    else unhashable falls back to id(). Every object fingerprinted by
+    identity is appended to refs: a cache that keys on these ids must hold
+    the refs alive, otherwise a garbage-collected object's id can be
+    reused by a different one and match a stale entry.
+    """
+    items = []
+    for key in sorted(params):
+        value = params[key]
+        if isinstance(value, np.ndarray):
+            if value.size <= 1024:
+                items.append((key, value.tobytes()))
+            else:
+                refs.append(value)
+                items.append((key, id(value)))
+        elif isinstance(value, dict):
+            items.append((key, _hash_params(value, refs)))
+        else:
+            try:
+                hash(value)
+            except TypeError:
+                refs.append(value)
+                items.append((key, id(value)))
+            else:
+                items.append((key, value))
+    return tuple(items)
+
+
+def _import_module(name):
+    """Import a module by name, consulting _MODULE_CACHE first."""
+    module = _MODULE_CACHE.get(name)
+    if module is None:
+        module = _MODULE_CACHE[name] = importlib.import_module(name)
+    return module
+
+
+def _eval_function_call(source):
+    """Evaluate a FUNCTION_CALL: expression, caching the compiled code."""
+    code = _EVAL_CACHE.get(source)
+    if code is None:
+        code = _EVAL_CACHE[source] = compile(source, '<FUNCTION_CALL>', 'eval')
+    return eval(code, _EVAL_GLOBALS)
+
+
+# the three directives are mutually exclusive, so one regex match replaces
+# three separate prefix checks
+_DIRECTIVE = re.compile(r'(CUSTOM_FUNCTION_RETURN|CUSTOM_CLASS|FUNCTION_CALL):(.*)', re.DOTALL)
+_DIRECTIVE_DISPATCH = {
+    'CUSTOM_FUNCTION_RETURN': lambda self, payload: self.custom_function_returns[payload],
+    'CUSTOM_CLASS': lambda self, payload: self.custom_classes[payload],
+    'FUNCTION_CALL': lambda self, payload: _eval_function_call(payload),
+}
+
+
+def _fast_ini_parse(config_file):
+    """
+    Minimal regex-based INI reader, a faster replacement for ConfigParser
+    on the simple ``key = value`` config files used here. Keys keep their
+    case, full-line comments (``;``/``#``) and blank lines are skipped, and
+    ``${section:key}`` / ``${key}`` references are expanded in a post-pass.
+
+    :param config_file: path to INI file to read
+    :return: OrderedDict of section name -> OrderedDict of key -> value
+    """
+    sections = collections.OrderedDict()
+    current = None
+    with open(config_file) as f:
+        for line in f:
+            line = line.strip()
+            section_match = _SECTION.match(line)
+            if section_match:
+                current = sections.setdefault(section_match.group(1), collections.OrderedDict())
+                continue
+            kv_match = _KV.match(line)
+            if kv_match and current is not None:
+                current[kv_match.group(1)] = kv_match.group(2)
+    # expand ${section:key} and same-section ${key} references
+    for _ in range(_MAX_INTERPOLATION_DEPTH):
+        dirty = False
+        for section, items in sections.items():
+            for key, value in items.items():
+                if '${' not in value:
+                    continue
+                items[key] = _INTERPOLATION.sub(
+                    lambda m: sections[m.group(1) or section][m.group(2)], value)
+                dirty = True
+        if not dirty:
+            break
+    return sections
+
+
+@functools.lru_cache(maxsize=None)
+def get_default_args_types_from_function(func):
+    """
+    Given a function, return two read-only mappings:
+    parameter name -> default value (parameters without defaults are skipped)
+    and parameter name -> annotated type.
+
+    Results are cached per function object because the same model functions
+    are looked up repeatedly across config sections, and
+    :func:`inspect.signature` is expensive. Callers that need to mutate the
+    returned mappings should copy them first with ``dict(...)``.
+
+    :param func: function (or unbound ``__init__``) to inspect
+    :return: (defaults, types) tuple of read-only mappings
+    """
+    signature = getattr(func, "__signature__", None)
+    if signature is None:
+        signature = inspect.signature(func)
+    defaults = {}
+    types = {}
+    empty = inspect.Parameter.empty
+    for name, parameter in signature.parameters.items():
+        if parameter.default is not empty:
+            defaults[name] = parameter.default
+        if parameter.annotation is empty:
+            logger.debug("in %s: parameter %s does not have an annotated type",
+                         func.__name__, name)
+        else:
+            types[name] = parameter.annotation
+    return MappingProxyType(defaults), MappingProxyType(types)
+
+
+def update_dictionary_with_subdictionary(dictionary, subdictionary):
+    """
+    Recursively update dictionary with (possibly nested) entries from
+    subdictionary, preferring the subdictionary values on conflicts.
+
+    :param dictionary: dictionary to update (may be None)
+    :param subdictionary: dictionary whose entries take precedence
+    :return: the updated dictionary
+    """
+    if dictionary is None:
+        return subdictionary
+    # iterative walk: config dicts are always plain dicts, so the concrete
+    # dict check is enough and recursion overhead is avoided
+    stack = collections.deque([(dictionary, subdictionary)])
+    while stack:
+        destination, source = stack.pop()
+        for key, value in source.items():
+            if isinstance(value, dict):
+                nested = destination.get(key)
+                if not isinstance(nested, dict):
+                    nested = {}
+                    destination[key] = nested
+                stack.append((nested, value))
+            else:
+                destination[key] = value
+    return dictionary
+
+
+if sys.version_info >= (3, 10):
+    # slots cut per-instance memory and make attribute access a C-level
+    # slot fetch; the dataclass keyword only exists on 3.10+
+    _dataclass = functools.partial(dataclass, slots=True)
+else:
+    _dataclass = dataclass
+
+
+@_dataclass
+class RunSettings:
+    """
+    Class for keeping track of enterprise model run settings,
+    read in from a config (INI) file.
+    """
+    pulsar_pickle: str = None
+    noise_dict_json: str = None
+    output_directory: str = None
+    emp_dist_path: str = None
+
+    # set False to fall back to configparser.ConfigParser
+    use_fast_parser: bool = True
+    # set False to instantiate per-pulsar models serially
+    parallel_model_build: bool = True
+
+    num_samples: int = int(1e6)
+    scam_weight: float = 30
+    am_weight: float = 15
+    de_weight: float = 50
+
+    custom_classes: dict = field(default_factory=dict)
+    custom_class_parameters: dict = field(default_factory=dict)
+    custom_function_returns: dict = field(default_factory=dict)
+    functions: dict = field(default_factory=dict)
+    function_parameters: dict = field(default_factory=dict)
+    pta_creating_functions: dict = field(default_factory=dict)
+    signal_creating_functions: dict = field(default_factory=dict)
+
+    psrs: list = None
+    noise_dict: dict = None
+
+    # pta objects memoized by (pulsars, section, parameters); cleared
+    # whenever new pulsars are loaded
+    _pta_cache: dict = field(default_factory=dict)
+
+    def update_from_file(self, config_file: str) -> None:
+        """
+        Read a config file and update the RunSettings from its sections.
+
+        [input] and [output] sections set attributes of this dataclass.
+        Sections containing a ``class`` key instantiate a custom class from
+        the module given by the ``module`` key. Sections containing a
+        ``function`` key load a custom function (its ``function_type`` key
+        says how it is used). Any other section name is looked up in
+        :mod:`enterprise_extensions.models`.
+
+        :param config_file: path to INI file to read
+        """
+        stat = os.stat(config_file)
+        # the two parsers can disagree on edge cases (multi-line values,
+        # $$ escapes), so a cached fast-parse must not satisfy an
+        # instance that opted out of the fast parser, and vice versa
+        cache_key = (config_file, stat.st_mtime_ns, stat.st_size, self.use_fast_parser)
+        if cache_key in _CONFIG_CACHE:
+            sections = _CONFIG_CACHE[cache_key]
+        elif self.use_fast_parser:
+            sections = _fast_ini_parse(config_file)
+            _CONFIG_CACHE[cache_key] = sections
+        else:
+            config = ConfigParser(interpolation=ExtendedInterpolation())
+            # do not lowercase keys: parameter names are case sensitive
+            config.optionxform = str
+            config.read(config_file)
+            # materialize every section into a plain dict: this forces
+            # ExtendedInterpolation to resolve ${section:key} references
+            # exactly once, and avoids caching the ConfigParser object
+            sections = collections.OrderedDict(
+                (section, dict(config.items(section))) for section in config.sections())
+            _CONFIG_CACHE[cache_key] = sections
+        # bind attributes touched in the loop to locals (LOAD_FAST is much
+        # cheaper than repeated LOAD_ATTR on self)
+        apply_types = self.apply_types
+        self_functions = self.functions
+        self_function_parameters = self.function_parameters
+        pta_creating_functions = self.pta_creating_functions
+        for section, section_items in sections.items():
+            config_file_items = dict(section_items)
+            if section == 'input' or section == 'output':
+                # empty entries are allowed in the config file but should not
+                # override the dataclass defaults
+                config_file_items = {key: value for key, value in config_file_items.items()
+                                     if value}
+                self.update_from_dict(**config_file_items)
+            elif 'class' in config_file_items:
+                # instantiate a class defined outside of enterprise_extensions
+                module = _import_module(config_file_items['module'])
+                custom_class = getattr(module, config_file_items['class'])
+                default_args, types = get_default_args_types_from_function(custom_class.__init__)
+                class_parameters = apply_types(config_file_items, types,
+                                               exclude_keys=['module', 'class'])
+                self.custom_class_parameters[section] = update_dictionary_with_subdictionary(
+                    dict(default_args), class_parameters)
+                self.custom_classes[section] = custom_class(**self.custom_class_parameters[section])
+            elif 'function' in config_file_items:
+                # load a function defined outside of enterprise_extensions
+                module = _import_module(config_file_items['module'])
+                custom_function = getattr(module, config_file_items['function'])
+                default_args, types = get_default_args_types_from_function(custom_function)
+                function_parameters = apply_types(
+                    config_file_items, types,
+                    exclude_keys=['module', 'function', 'function_type'])
+                self_functions[section] = custom_function
+                self_function_parameters[section] = update_dictionary_with_subdictionary(
+                    dict(default_args), function_parameters)
+                function_type = config_file_items['function_type']
+                if function_type == 'pta_creating_function':
+                    pta_creating_functions[section] = custom_function
+                elif function_type == 'signal_creating_function':
+                    self.signal_creating_functions[section] = custom_function
+                elif function_type == 'store_return':
+                    # call now so later sections can refer to the result
+                    # via CUSTOM_FUNCTION_RETURN:
+                    self.custom_function_returns[section] = custom_function(
+                        **self_function_parameters[section])
+                else:
+                    logger.warning("unknown function_type %s in section %s",
+                                   function_type, section)
+            else:
+                # a model function from enterprise_extensions.models
+                # (imported lazily: it pulls in the whole enterprise stack)
+                import enterprise_extensions.models
+                model_function = getattr(enterprise_extensions.models, section)
+                default_args, types = get_default_args_types_from_function(model_function)
+                function_parameters = apply_types(config_file_items, types)
+                self_functions[section] = model_function
+                self_function_parameters[section] = update_dictionary_with_subdictionary(
+                    dict(default_args), function_parameters)
+                pta_creating_functions[section] = model_function
+
+    @classmethod
+    def _build_coercers(cls):
+        """
+        Cache a field name -> (type, string converter) table from the
+        dataclass annotations. The converter comes from _TYPE_HANDLERS
+        where one exists (bool in particular: bool("False") is True),
+        falling back to the type itself; annotations that are not
+        concrete types get no coercion. Called once after the class body
+        runs.
+        """
+        cls._COERCERS = {}
+        for name, dtype in cls.__annotations__.items():
+            if isinstance(dtype, type):
+                cls._COERCERS[name] = (dtype, _TYPE_HANDLERS.get(dtype, dtype))
+            else:
+                cls._COERCERS[name] = (None, None)
+
+    def update_from_dict(self, **kwargs):
+        """
+        Set attributes of this dataclass from keyword arguments, coercing
+        values to the annotated types where possible.
+        """
+        coercers = self._COERCERS
+        for name, value in kwargs.items():
+            if name not in coercers:
+                continue
+            dtype, from_string = coercers[name]
+            if dtype is not None and not isinstance(value, dtype):
+                try:
+                    value = from_string(value) if isinstance(value, str) else dtype(value)
+                except TypeError:
+                    pass
+            setattr(self, name, value)
+
+    def apply_types(self, dictionary, type_dictionary, exclude_keys=[]):
+        """
+        Convert the string values read from a config section into the types
+        given in type_dictionary.
+
+        Values may instead contain one of three directives:
+        ``CUSTOM_CLASS:<section>`` refers to a previously instantiated custom
+        class, ``CUSTOM_FUNCTION_RETURN:<section>`` to a previously stored
+        function return, and ``FUNCTION_CALL:<expression>`` is evaluated
+        (with only ``np`` and ``math`` available).
+
+        :param dictionary: section items (string -> string)
+        :param type_dictionary: parameter name -> type
+        :param exclude_keys: keys to skip entirely
+        :return: dictionary of converted values
+        """
+        # directives depend on self (custom classes / function returns), so
+        # they are split off and applied after the cacheable conversions
+        plain = {}
+        directives = {}
+        for key, value in dictionary.items():
+            if key in exclude_keys:
+                continue
+            match = _DIRECTIVE.match(value)
+            if match:
+                directives[key] = match
+            else:
+                plain[key] = value
+        cache_key = (frozenset(plain.items()),
+                     tuple(sorted(type_dictionary.items(), key=lambda kv: kv[0])))
+        if cache_key in _APPLY_TYPES_CACHE:
+            out = dict(_APPLY_TYPES_CACHE[cache_key])
+        else:
+            out = {}
+            for key, value in plain.items():
+                if key not in type_dictionary:
+                    logger.debug("%s has no annotated type, interpreting as a string", key)
+                    out[key] = value
+                    continue
+                dtype = type_dictionary[key]
+                out[key] = _TYPE_HANDLERS.get(dtype, dtype)(value)
+            _APPLY_TYPES_CACHE[cache_key] = out
+            out = dict(out)
+        for key, match in directives.items():
+            out[key] = _DIRECTIVE_DISPATCH[match.group(1)](self, match.group(2))
+        return out
+
+    def load_pickled_pulsars(self):
+        """
+        Load the pulsars from pulsar_pickle and the noise dictionary from
+        noise_dict_json.
+
+        Pulsar pickles are large, so they are read through a 1 MiB buffer.
+        Loading is fastest when the file was written with
+        ``pickle.HIGHEST_PROTOCOL`` (re-pickle once with that protocol, or
+        use ``joblib.dump``/``joblib.load`` to memory-map the arrays).
+        """
+        # new pulsars invalidate any memoized pta objects
+        self._pta_cache.clear()
+        with open(self.pulsar_pickle, 'rb', buffering=1 << 20) as f:
+            self.psrs = pickle.load(f)
+        with open(self.noise_dict_json, 'rb') as f:
+            if orjson is not None:
+                self.noise_dict = orjson.loads(f.read())
+            else:
+                self.noise_dict = json.load(f)
+        noise_dict = self.noise_dict
+        # alias PSR_log10_ecorr_... entries as PSR_basis_ecorr_...; one
+        # split per matching key and one C-level bulk update
+        parts_by_par = {par: par.split('_', 1)
+                        for par in noise_dict
+                        if 'log10_ecorr' in par and 'basis_ecorr' not in par}
+        noise_dict.update({f"{prefix}_basis_ecorr_{rest}": noise_dict[par]
+                           for par, (prefix, rest) in parts_by_par.items()})
+
+    def get_pta_objects(self):
+        """
+        Call every pta creating function and return the resulting list of
+        pta objects.
+        """
+        if self.psrs is None:
+            self.load_pickled_pulsars()
+        pta_list = []
+        for key in self.pta_creating_functions.keys():
+            params = self.function_parameters[key]
+            refs = [self.psrs]
+            cache_key = (id(self.psrs), key, _hash_params(params, refs))
+            cached = self._pta_cache.get(cache_key)
+            if cached is None:
+                pta = self.pta_creating_functions[key](psrs=self.psrs, **params)
+                # storing refs keeps the id'd objects alive, so an id in
+                # the key can only ever match the object it came from
+                self._pta_cache[cache_key] = (pta, refs)
+            else:
+                pta = cached[0]
+            pta_list.append(pta)
+        return pta_list
+
+    @staticmethod
+    def get_signal_collection_from_pta_object(pta):
+        """
+        Get the signal collection class back out of an instantiated pta
+        object.
+        """
+        return pta.pulsarmodels[0].__class__
+
+    def create_pta_object_from_signals(self):
+        """
+        Combine the signal collections of all pta creating functions into a
+        single pta object covering every pulsar.
+        """
+        from enterprise.signals import signal_base
+
+        pta_list = self.get_pta_objects()
+        signal_collections = [pta.pulsarmodels[0].__class__ for pta in pta_list]
+        signal_collection = functools.reduce(operator.add, signal_collections)
+        if self.parallel_model_build and len(self.psrs) > 1:
+            # each instantiation is independent and numpy-heavy (the GIL is
+            # released in the linear algebra), so threads give a real
+            # speedup without pickling the large pulsar objects
+            with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+                model_list = list(executor.map(signal_collection, self.psrs))
+        else:
+            model_list = [signal_collection(psr) for psr in self.psrs]
+        pta = signal_base.PTA(model_list)
+        if self.noise_dict is not None:
+            pta.set_default_params(self.noise_dict)
+        return pta
+
+
+# built once: the dataclass annotations never change after the class body
+# runs, so update_from_dict reads a precomputed coercion table
+RunSettings._build_coercers()
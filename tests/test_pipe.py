@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `enterprise_extensions.pipe` module."""
+
+import json
+import pickle
+from configparser import ConfigParser, ExtendedInterpolation
+
+import numpy as np
+import pytest
+
+from enterprise_extensions.pipe import data_class
+from enterprise_extensions.pipe.data_class import (RunSettings,
+                                                   _fast_ini_parse,
+                                                   update_dictionary_with_subdictionary)
+
+config_text = """
+[input]
+pulsar_pickle = /data/psrs.pkl
+noise_dict_json = ${input:pulsar_pickle}.json
+emp_dist_path =
+
+; full-line comment
+# another comment
+[output]
+output_directory = /data/chains/${input:pulsar_pickle}
+"""
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    """The module caches are global; keep the tests independent."""
+    data_class._CONFIG_CACHE.clear()
+    data_class._APPLY_TYPES_CACHE.clear()
+    yield
+    data_class._CONFIG_CACHE.clear()
+    data_class._APPLY_TYPES_CACHE.clear()
+
+
+@pytest.fixture
+def config_file(tmp_path):
+    path = tmp_path / 'run.ini'
+    path.write_text(config_text)
+    return str(path)
+
+
+def test_fast_ini_parse_matches_configparser(config_file):
+    config = ConfigParser(interpolation=ExtendedInterpolation())
+    config.optionxform = str
+    config.read(config_file)
+    expected = {section: dict(config.items(section)) for section in config.sections()}
+
+    sections = _fast_ini_parse(config_file)
+    assert {section: dict(items) for section, items in sections.items()} == expected
+    # interpolation is resolved at parse time
+    assert sections['input']['noise_dict_json'] == '/data/psrs.pkl.json'
+    assert sections['output']['output_directory'] == '/data/chains//data/psrs.pkl'
+
+
+def test_update_from_file_both_parsers(config_file):
+    for use_fast_parser in [True, False]:
+        rs = RunSettings(use_fast_parser=use_fast_parser)
+        rs.update_from_file(config_file)
+        assert rs.pulsar_pickle == '/data/psrs.pkl'
+        assert rs.noise_dict_json == '/data/psrs.pkl.json'
+        # empty entries must not override the dataclass defaults
+        assert rs.emp_dist_path is None
+
+
+def test_config_cache(config_file, monkeypatch):
+    calls = []
+    fast_ini_parse = data_class._fast_ini_parse
+    monkeypatch.setattr(data_class, '_fast_ini_parse',
+                        lambda path: calls.append(path) or fast_ini_parse(path))
+    rs = RunSettings()
+    rs.update_from_file(config_file)
+    RunSettings().update_from_file(config_file)
+    assert len(calls) == 1
+
+    # an instance that opted out of the fast parser gets its own entry
+    RunSettings(use_fast_parser=False).update_from_file(config_file)
+    assert len(calls) == 1
+    assert len(data_class._CONFIG_CACHE) == 2
+
+
+def test_apply_types():
+    rs = RunSettings()
+    rs.custom_classes['myclass'] = object()
+    rs.custom_function_returns['myfunc'] = object()
+    types = {'x': float, 'n': int, 'flag': bool, 'arr': np.ndarray, 'name': str}
+    items = {'x': '1.5', 'n': '3', 'flag': 'False', 'arr': '1,2,3', 'name': 'abc',
+             'cls': 'CUSTOM_CLASS:myclass',
+             'ret': 'CUSTOM_FUNCTION_RETURN:myfunc',
+             'call': 'FUNCTION_CALL:np.arange(3)',
+             'skipme': 'whatever'}
+    out = rs.apply_types(items, types, exclude_keys=['skipme'])
+    assert out['x'] == 1.5 and isinstance(out['x'], float)
+    assert out['n'] == 3 and isinstance(out['n'], int)
+    assert out['flag'] is False
+    assert np.array_equal(out['arr'], np.array([1.0, 2.0, 3.0]))
+    assert out['name'] == 'abc'
+    assert out['cls'] is rs.custom_classes['myclass']
+    assert out['ret'] is rs.custom_function_returns['myfunc']
+    assert np.array_equal(out['call'], np.arange(3))
+    assert 'skipme' not in out
+
+
+def test_apply_types_bool_strings():
+    rs = RunSettings()
+    types = {'flag': bool}
+    for value, expected in [('True', True), ('true', True), ('1', True), ('yes', True),
+                            ('False', False), ('false', False), ('0', False)]:
+        assert rs.apply_types({'flag': value}, types)['flag'] is expected
+
+
+def test_apply_types_cache():
+    rs = RunSettings()
+    types = {'x': float}
+    first = rs.apply_types({'x': '1.5'}, types)
+    assert len(data_class._APPLY_TYPES_CACHE) == 1
+    second = rs.apply_types({'x': '1.5'}, types)
+    assert second == first
+    # callers get a copy, not the cached dict itself
+    first['x'] = 99.0
+    assert rs.apply_types({'x': '1.5'}, types)['x'] == 1.5
+
+
+def test_function_call_restricted_globals():
+    rs = RunSettings()
+    with pytest.raises(NameError):
+        rs.apply_types({'bad': "FUNCTION_CALL:__import__('os').getcwd()"}, {})
+
+
+def test_update_from_dict_coercion():
+    rs = RunSettings()
+    rs.update_from_dict(num_samples='1000', scam_weight='2.5',
+                        use_fast_parser='False', output_directory='/tmp/out',
+                        not_a_field='ignored')
+    assert rs.num_samples == 1000
+    assert rs.scam_weight == 2.5
+    assert rs.use_fast_parser is False
+    assert rs.output_directory == '/tmp/out'
+    assert not hasattr(rs, 'not_a_field')
+
+
+def test_update_dictionary_with_subdictionary():
+    dictionary = {'a': 1, 'b': {'x': 1, 'y': {'deep': 0}}}
+    subdictionary = {'b': {'y': {'deep': 9, 'new': 2}, 'z': 3}, 'c': 4}
+    merged = update_dictionary_with_subdictionary(dictionary, subdictionary)
+    assert merged == {'a': 1, 'b': {'x': 1, 'y': {'deep': 9, 'new': 2}, 'z': 3}, 'c': 4}
+    assert update_dictionary_with_subdictionary(None, {'q': 1}) == {'q': 1}
+
+
+def test_load_pickled_pulsars_ecorr_rewrite(tmp_path):
+    psr_path = tmp_path / 'psrs.pkl'
+    with open(psr_path, 'wb') as fout:
+        pickle.dump(['fake_psr'], fout)
+    noise_path = tmp_path / 'noise.json'
+    noise = {'J1909-3744_log10_ecorr_x': -7.0,
+             'J1909-3744_basis_ecorr_log10_ecorr_y': -6.0,
+             'J1909-3744_efac': 1.0}
+    with open(noise_path, 'w') as fout:
+        json.dump(noise, fout)
+
+    rs = RunSettings(pulsar_pickle=str(psr_path), noise_dict_json=str(noise_path))
+    rs.load_pickled_pulsars()
+    assert rs.psrs == ['fake_psr']
+    expected = dict(noise)
+    expected['J1909-3744_basis_ecorr_log10_ecorr_x'] = -7.0
+    assert rs.noise_dict == expected